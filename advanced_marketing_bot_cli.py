@@ -1,62 +1,62 @@
 import os
 import json
+import uuid
 from datetime import datetime
 from dotenv import load_dotenv
-from openai import OpenAI
+from completion_backends import build_backend
+import structured_reports
+from structured_reports import (
+    StrategyReport, SocialMediaPlan, FunnelReport, SEOReport, BudgetReport,
+    StructuredOutputError
+)
+from session_index import SessionIndex, build_context_messages
+from request_scheduler import INTERACTIVE, BATCH, get_scheduler
+from prompt_registry import registry as prompts
+import session_archive
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the OpenAI client only if being run directly
+# Initialize the completion backend only if being run directly
 api_key = os.getenv("OPENAI_API_KEY")
-if not api_key and __name__ == "__main__":
+backend_spec = os.getenv("COMPLETION_BACKENDS")
+if not api_key and not backend_spec and __name__ == "__main__":
     raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file or system environment.")
 
-client = None
-if api_key:
-    client = OpenAI(api_key=api_key)
+backend = None
+if api_key or backend_spec:
+    backend = build_backend(api_key)
 
 class AdvancedMarketingConsultant:
     """An advanced digital marketing consultancy bot with specialized functions."""
     
-    def __init__(self):
+    def __init__(self, completion_backend=None):
+        self.backend = completion_backend or backend
         self.conversation_history = []
         self.sessions = {}
         self.current_session = None
-        self.system_prompt = """You are an expert digital marketing consultant with 15+ years of experience.
-        
-Your expertise includes:
-- Strategic digital marketing planning
-- SEO and SEM optimization
-- Social media marketing and management
-- Content marketing and strategy
-- Email marketing campaigns
-- PPC advertising (Google Ads, Facebook Ads)
-- Marketing analytics and data interpretation
-- Brand development and positioning
-- Customer acquisition and retention strategies
-- Marketing automation
-- Conversion rate optimization
-- Market research and competitor analysis
-- Growth hacking techniques
-- Influencer marketing
-- Video marketing strategy
-
-When responding:
-1. Provide specific, actionable recommendations
-2. Consider budget, industry, and target audience
-3. Suggest data-driven metrics to track success
-4. Offer both quick wins and long-term strategies
-5. Be practical about timelines and ROI expectations
-6. Ask clarifying questions when needed
-7. Provide examples and case studies when relevant
-
-Maintain a professional, consultative tone while being approachable."""
+        self.structured_retries = 2
+        # When retrieval_k > 0, only the top-k relevant prior turns plus the
+        # last retrieval_recent turns are sent instead of the whole history
+        self.retrieval_k = 0
+        self.retrieval_recent = 2
+        self.session_index = SessionIndex()
+        self.session_index.refresh()
+        # Turns outside any session are indexed under this id so the
+        # current conversation stays retrievable in 'memory' mode
+        self.conversation_id = f"conversation_{uuid.uuid4().hex[:12]}"
+        # Completion calls go through the shared scheduler; specialized
+        # reports are queued as batch work behind interactive chat turns
+        self.tenant = "cli"
+        self.last_queue_wait = 0.0
+        self.system_prompt = prompts.render("system.chat")
+        self.last_prompt_stats = None
     
     def create_session(self, session_name: str) -> str:
         """Create a new consultation session."""
         session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         self.sessions[session_id] = {
+            "id": session_id,
             "name": session_name,
             "created": datetime.now().isoformat(),
             "history": []
@@ -64,140 +64,154 @@ Maintain a professional, consultative tone while being approachable."""
         self.current_session = session_id
         return session_id
     
-    def analyze_marketing_strategy(self, strategy_description: str) -> str:
+    def analyze_marketing_strategy(self, strategy_description: str, structured: bool = False, on_section=None):
         """Analyze a marketing strategy and provide recommendations."""
-        prompt = f"""Please analyze the following marketing strategy and provide:
-1. Strengths
-2. Weaknesses
-3. Opportunities for improvement
-4. Potential risks
-5. ROI estimation
-6. 90-day action plan
-
-Strategy Description:
-{strategy_description}"""
-        
-        return self.chat(prompt)
+        return self._report("report.strategy", StrategyReport, structured, on_section, strategy_description=strategy_description)
     
-    def generate_social_media_plan(self, industry: str, audience: str, budget: str) -> str:
+    def generate_social_media_plan(self, industry: str, audience: str, budget: str, structured: bool = False, on_section=None):
         """Generate a social media marketing plan."""
-        prompt = f"""Create a comprehensive social media marketing plan with:
-1. Platform selection and justification
-2. Content calendar overview (30 days)
-3. Posting frequency and best times
-4. Content types and themes
-5. Engagement strategies
-6. Analytics metrics to track
-7. Budget allocation per platform
-
-Industry: {industry}
-Target Audience: {audience}
-Monthly Budget: {budget}"""
-        
-        return self.chat(prompt)
+        return self._report("report.social", SocialMediaPlan, structured, on_section, industry=industry, audience=audience, budget=budget)
     
-    def optimize_conversion_funnel(self, funnel_description: str) -> str:
+    def optimize_conversion_funnel(self, funnel_description: str, structured: bool = False, on_section=None):
         """Provide recommendations to optimize a conversion funnel."""
-        prompt = f"""Analyze this conversion funnel and provide optimization recommendations:
-
-Current Funnel:
-{funnel_description}
-
-Please provide:
-1. Identified bottlenecks
-2. Conversion rate improvement strategies
-3. A/B testing recommendations
-4. Landing page optimization tips
-5. Call-to-action improvements
-6. Implementation priority and timeline"""
-        
-        return self.chat(prompt)
+        return self._report("report.funnel", FunnelReport, structured, on_section, funnel_description=funnel_description)
     
-    def seo_audit_recommendations(self, website_info: str) -> str:
+    def seo_audit_recommendations(self, website_info: str, structured: bool = False, on_section=None):
         """Provide SEO audit recommendations."""
-        prompt = f"""Based on this website information, provide comprehensive SEO recommendations:
-
-Website Info:
-{website_info}
-
-Include:
-1. On-page SEO improvements
-2. Technical SEO fixes
-3. Backlink strategy
-4. Keyword research focus areas
-5. Content optimization priorities
-6. Local SEO recommendations (if applicable)
-7. Competitive analysis insights
-8. Implementation roadmap with timeline and priority"""
-        
-        return self.chat(prompt)
+        return self._report("report.seo", SEOReport, structured, on_section, website_info=website_info)
     
-    def budget_allocation_plan(self, total_budget: str, goals: str, industry: str) -> str:
+    def budget_allocation_plan(self, total_budget: str, goals: str, industry: str, structured: bool = False, on_section=None):
         """Create a budget allocation plan across marketing channels."""
-        prompt = f"""Create a detailed budget allocation plan with:
-
-Total Budget: {total_budget}
-Business Goals: {goals}
-Industry: {industry}
-
-Provide:
-1. Recommended channel allocation (percentages and amounts)
-2. Justification for each allocation
-3. Expected ROI by channel
-4. Month-by-month breakdown for first 90 days
-5. Quick wins vs. long-term investments
-6. Contingency recommendations
-7. Key metrics to monitor per channel"""
-        
-        return self.chat(prompt)
+        return self._report("report.budget", BudgetReport, structured, on_section, total_budget=total_budget, goals=goals, industry=industry)
     
-    def chat(self, user_message: str) -> str:
+    def _report(self, template_name: str, report_cls, structured: bool, on_section, **values):
+        """Run a specialized report as free-form text or as a structured record."""
+        template = prompts.get(template_name)
+        if structured:
+            return self._structured_report(template, values, report_cls, on_section)
+        return self.chat(template.render(**values), priority=BATCH)
+    
+    def chat(self, user_message: str, priority: int = INTERACTIVE) -> str:
         """Send a message to the bot and get a response."""
         # Add user message to history
+        self._record_turn("user", user_message)
+        
+        # Get response from the completion backend
+        assistant_message = self._complete(self._build_messages(), priority)
+        
+        # Add assistant response to history
+        self._record_turn("assistant", assistant_message)
+        
+        return assistant_message
+    
+    def _record_turn(self, role: str, content: str):
+        """Add a turn to the conversation history and the active session."""
         self.conversation_history.append({
-            "role": "user",
-            "content": user_message
+            "role": role,
+            "content": content
         })
         
+        turn = {
+            "role": role,
+            "content": content,
+            "timestamp": datetime.now().isoformat()
+        }
+        
         # Store in session if exists
         if self.current_session and self.current_session in self.sessions:
-            self.sessions[self.current_session]["history"].append({
-                "role": "user",
-                "content": user_message,
-                "timestamp": datetime.now().isoformat()
-            })
+            session = self.sessions[self.current_session]
+            session["history"].append(turn)
+            self.session_index.add_turn(self.current_session, session["name"], turn)
+        else:
+            self.session_index.add_turn(self.conversation_id, "current conversation", turn)
+    
+    def _build_messages(self) -> list:
+        """Build the message list sent to the API."""
+        if self.retrieval_k > 0 and self.conversation_history:
+            recent = self.conversation_history[-(self.retrieval_recent + 1):]
+            history = build_context_messages(
+                self.session_index, recent[-1]["content"], self.retrieval_k, recent
+            )
+        else:
+            history = self.conversation_history
         
-        # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": self.system_prompt
-                }
-            ] + self.conversation_history,
-            temperature=0.7,
-            max_tokens=1500
+        return [
+            {
+                "role": "system",
+                "content": self.system_prompt
+            }
+        ] + history
+    
+    def _complete(self, messages: list, priority: int = INTERACTIVE, **kwargs) -> str:
+        """Run a single chat completion and return the response text."""
+        self.last_prompt_stats = prompts.prefix_stats(messages)
+        with get_scheduler().slot(priority, self.tenant) as ticket:
+            self.last_queue_wait = ticket.wait_time
+            return self.backend.complete(messages, temperature=0.7, max_tokens=1500, **kwargs)
+    
+    def _stream(self, messages: list, priority: int = INTERACTIVE, **kwargs):
+        """Run a streaming chat completion, yielding text deltas."""
+        self.last_prompt_stats = prompts.prefix_stats(messages)
+        with get_scheduler().slot(priority, self.tenant) as ticket:
+            self.last_queue_wait = ticket.wait_time
+            yield from self.backend.stream(messages, temperature=0.7, max_tokens=1500, **kwargs)
+    
+    def _structured_report(self, template, values: dict, report_cls, on_section=None):
+        """Request a report as schema-constrained JSON and parse it into `report_cls`.
+        
+        When `on_section` is given the response is streamed and
+        `on_section(name, value)` is called as soon as each section is parsed.
+        Invalid or missing sections are re-requested on their own, up to
+        `structured_retries` times.
+        """
+        request = structured_reports.build_request(
+            template.static, report_cls, template.render_variable(**values)
         )
+        self._record_turn("user", request)
+        messages = self._build_messages()
         
-        # Extract assistant response
-        assistant_message = response.choices[0].message.content
+        if on_section is None:
+            raw = self._complete(messages, BATCH, response_format=structured_reports.RESPONSE_FORMAT)
+        else:
+            parser = structured_reports.SectionStreamParser()
+            chunks = []
+            for delta in self._stream(messages, BATCH, response_format=structured_reports.RESPONSE_FORMAT):
+                chunks.append(delta)
+                for name, value in parser.feed(delta):
+                    try:
+                        on_section(name, structured_reports.parse_section(report_cls, name, value))
+                    except ValueError:
+                        # Left for the repair request below
+                        pass
+            raw = "".join(chunks)
         
-        # Add assistant response to history
-        self.conversation_history.append({
-            "role": "assistant",
-            "content": assistant_message
-        })
+        sections, invalid = structured_reports.parse_sections(report_cls, raw)
         
-        # Store in session if exists
-        if self.current_session and self.current_session in self.sessions:
-            self.sessions[self.current_session]["history"].append({
-                "role": "assistant",
-                "content": assistant_message,
-                "timestamp": datetime.now().isoformat()
-            })
+        # Retry only the fragment that failed validation
+        for _ in range(self.structured_retries):
+            if not invalid:
+                break
+            repair_messages = messages + [
+                {"role": "assistant", "content": raw},
+                {"role": "user", "content": structured_reports.build_repair_request(report_cls, invalid)}
+            ]
+            repaired = self._complete(repair_messages, BATCH, response_format=structured_reports.RESPONSE_FORMAT)
+            fixed, invalid = structured_reports.parse_sections(report_cls, repaired, only=invalid)
+            sections.update(fixed)
+            if on_section is not None:
+                for name, value in fixed.items():
+                    on_section(name, value)
         
-        return assistant_message
+        # Record the validated sections rather than the raw first response,
+        # so history, saved sessions and exports never keep a broken report
+        ordered = {name: sections[name] for name in report_cls.__dataclass_fields__ if name in sections}
+        self._record_turn("assistant", json.dumps(structured_reports.to_jsonable(ordered)))
+        
+        if invalid:
+            raise StructuredOutputError(f"Invalid report sections after retries: {', '.join(invalid)}")
+        
+        # Keep the declared section order regardless of arrival order
+        return report_cls(**ordered)
     
     def save_session(self, filename: str = None) -> str:
         """Save current session to a JSON file."""
@@ -210,12 +224,52 @@ Provide:
         
         with open(filename, 'w') as f:
             json.dump(session, f, indent=2)
+        self.session_index.refresh()
         
         return f"Session saved to {filename}"
     
+    def export_sessions(self, path: str, since=None, until=None, name: str = None) -> str:
+        """Export all sessions of this consultant to a compressed archive."""
+        skipped = []
+        count = session_archive.export_sessions(self.sessions.items(), path, since, until, name, skipped)
+        message = f"Exported {count} turns to {path}"
+        if skipped:
+            message += f" (skipped {len(skipped)} sessions with a malformed creation date)"
+        return message
+    
+    def import_sessions(self, path: str, since=None, until=None, name: str = None) -> str:
+        """Load sessions from an archive into this consultant."""
+        # Reject badly ordered archives before touching the loaded sessions
+        session_archive.check_archive(path)
+        count = 0
+        skipped = []
+        for session_id, session in session_archive.iter_archive(path, since, until, name, skipped):
+            self.sessions[session_id] = session
+            self.session_index.index_session(session_id, session)
+            count += 1
+        message = f"Imported {count} sessions from {path}"
+        if skipped:
+            message += f" (skipped {len(skipped)} sessions with a malformed creation date)"
+        return message
+    
     def reset_conversation(self):
         """Reset conversation history."""
         self.conversation_history = []
+        # Keep 'memory' mode from retrieving the cleared turns
+        self.session_index.remove_session(self.conversation_id)
+    
+    def search_sessions(self, query: str, k: int = 5) -> str:
+        """Search saved and current sessions for relevant past advice."""
+        self.session_index.refresh()
+        results = self.session_index.search(query, k)
+        if not results:
+            return "No matching turns found."
+        
+        result = "Search results:\n"
+        for r in results:
+            preview = " ".join(r["content"].split())[:150]
+            result += f"  - [{r['score']}] {r['session_name']} ({r['session_id']}, {r['role']}): {preview}\n"
+        return result
     
     def list_sessions(self) -> str:
         """List all sessions."""
@@ -244,11 +298,32 @@ def main():
     print("  'session'   - Create new consultation session")
     print("  'list'      - List all sessions")
     print("  'save'      - Save current session")
+    print("  'export'    - Export all sessions to an archive")
+    print("  'import'    - Import sessions from an archive")
+    print("  'search'    - Search past sessions")
+    print("  'memory'    - Use top-k relevant past turns instead of full history")
+    print("  'json'      - Toggle structured JSON output for reports")
+    print("  'stats'     - Show queue wait and prompt cache stats of the last request")
     print("  'clear'     - Clear conversation history")
     print("  'quit'      - Exit the bot")
     print("\n" + "=" * 70 + "\n")
     
     consultant = AdvancedMarketingConsultant()
+    structured = False
+    
+    def print_section(name, value):
+        """Print a report section as soon as it has been parsed."""
+        print(f"\n[{name}]")
+        print(json.dumps(structured_reports.to_jsonable(value), indent=2))
+    
+    def run_report(report, *args):
+        """Run a specialized report in the currently selected output mode."""
+        print("\n🤖 Consultant: ", end="")
+        if structured:
+            report(*args, structured=True, on_section=print_section)
+            print()
+        else:
+            print(report(*args) + "\n")
     
     while True:
         try:
@@ -278,42 +353,66 @@ def main():
                 consultant.reset_conversation()
                 print("✓ Conversation history cleared.\n")
             
+            elif user_input.lower() == 'export':
+                path = input("Archive path [sessions.jsonl.gz]: ").strip() or "sessions.jsonl.gz"
+                since = input("Created on or after (YYYY-MM-DD, optional): ").strip() or None
+                name = input("Session name pattern (optional): ").strip() or None
+                print(f"✓ {consultant.export_sessions(path, since=since, name=name)}\n")
+            
+            elif user_input.lower() == 'import':
+                path = input("Archive path: ").strip()
+                print(f"✓ {consultant.import_sessions(path)}\n")
+            
+            elif user_input.lower() == 'search':
+                query = input("Search for: ").strip()
+                print(consultant.search_sessions(query) + "\n")
+            
+            elif user_input.lower() == 'memory':
+                k = input("Number of past turns to include (0 = full history): ").strip()
+                consultant.retrieval_k = int(k) if k.isdigit() else 0
+                if consultant.retrieval_k:
+                    print(f"✓ Using the top {consultant.retrieval_k} relevant past turns as context.\n")
+                else:
+                    print("✓ Using the full conversation history as context.\n")
+            
+            elif user_input.lower() == 'stats':
+                print(f"Queue wait: {consultant.last_queue_wait * 1000:.0f} ms")
+                stats = consultant.last_prompt_stats
+                if stats:
+                    print(f"Cacheable prompt prefix: {stats['ratio']:.0%} "
+                          f"({stats['cacheable_tokens']}/{stats['total_tokens']} tokens, {stats['template']})")
+                print()
+            
+            elif user_input.lower() == 'json':
+                structured = not structured
+                print(f"✓ Structured JSON output {'enabled' if structured else 'disabled'}.\n")
+            
             elif user_input.lower() == 'strategy':
                 print("\nDescribe your marketing strategy:")
                 strategy = input().strip()
-                print("\n🤖 Consultant: ", end="")
-                response = consultant.analyze_marketing_strategy(strategy)
-                print(response + "\n")
+                run_report(consultant.analyze_marketing_strategy, strategy)
             
             elif user_input.lower() == 'social':
                 industry = input("Industry: ").strip()
                 audience = input("Target audience: ").strip()
                 budget = input("Monthly budget: ").strip()
-                print("\n🤖 Consultant: ", end="")
-                response = consultant.generate_social_media_plan(industry, audience, budget)
-                print(response + "\n")
+                run_report(consultant.generate_social_media_plan, industry, audience, budget)
             
             elif user_input.lower() == 'funnel':
                 print("Describe your conversion funnel:")
                 funnel = input().strip()
-                print("\n🤖 Consultant: ", end="")
-                response = consultant.optimize_conversion_funnel(funnel)
-                print(response + "\n")
+                run_report(consultant.optimize_conversion_funnel, funnel)
             
             elif user_input.lower() == 'seo':
                 print("Describe your website:")
                 website = input().strip()
-                print("\n🤖 Consultant: ", end="")
-                response = consultant.seo_audit_recommendations(website)
-                print(response + "\n")
+                run_report(consultant.seo_audit_recommendations, website)
             
             elif user_input.lower() == 'budget':
                 budget = input("Total budget: ").strip()
                 goals = input("Business goals: ").strip()
                 industry = input("Industry: ").strip()
-                print("\n🤖 Consultant: ", end="")
-                response = consultant.budget_allocation_plan(budget, goals, industry)
-                print(response + "\n")
+                run_report(consultant.budget_allocation_plan, budget, goals, industry)
             
             else:
                 print("\n🤖 Consultant: ", end="")
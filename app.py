@@ -1,6 +1,11 @@
 import os
+import uuid
+from contextlib import nullcontext
 import streamlit as st
-from openai import OpenAI
+from completion_backends import build_backend
+from request_scheduler import BATCH, INTERACTIVE, get_scheduler
+from session_store import SessionStore
+from prompt_registry import registry as prompts
 
 # Set page config FIRST
 st.set_page_config(
@@ -13,6 +18,10 @@ st.set_page_config(
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Identifies this browser session to the request scheduler and session store
+if "tenant_id" not in st.session_state:
+    st.session_state.tenant_id = uuid.uuid4().hex
+
 # Get API key
 api_key = None
 try:
@@ -20,17 +29,40 @@ try:
 except (FileNotFoundError, KeyError):
     api_key = os.getenv("OPENAI_API_KEY")
 
-if not api_key:
+if not api_key and not os.getenv("COMPLETION_BACKENDS"):
     st.error("❌ API Key Error - OPENAI_API_KEY not configured")
     st.info("Add OPENAI_API_KEY to Streamlit Secrets (Settings → Secrets tab)")
     st.stop()
 
+@st.cache_resource
+def get_backend(api_key):
+    """Share one completion backend (and its health tracking) across all users."""
+    return build_backend(api_key)
+
 try:
-    client = OpenAI(api_key=api_key)
+    backend = get_backend(api_key)
 except Exception as e:
     st.error(f"❌ API Error: {str(e)}")
     st.stop()
 
+@st.cache_resource
+def get_session_store(path):
+    """Share one session store (and its read cache) across all users."""
+    return SessionStore(path)
+
+# External state mode: conversations live in a shared SQLite file keyed by the
+# ?session= URL parameter, so any replica can serve any user after a restart
+session_store = None
+store_path = os.getenv("SESSION_STORE_PATH")
+if store_path:
+    session_store = get_session_store(store_path)
+    params = st.experimental_get_query_params()
+    if "session" in params:
+        st.session_state.tenant_id = params["session"][0]
+    else:
+        st.experimental_set_query_params(session=st.session_state.tenant_id)
+    st.session_state.messages = session_store.load(st.session_state.tenant_id)
+
 # Header
 st.title("🎯 Digital Marketing Consultancy Bot")
 st.caption("Powered by OpenAI GPT-3.5-turbo")
@@ -52,15 +84,17 @@ with st.sidebar:
     
     if st.button("🗑️ Clear Chat"):
         st.session_state.messages = []
+        if session_store is not None:
+            session_store.clear(st.session_state.tenant_id)
         st.success("Chat cleared!")
 
-# System prompts
+# System prompts from the shared prompt registry
 system_prompts = {
-    "💬 Chat": "You are an expert digital marketing consultant with 15+ years of experience. Provide specific, actionable recommendations.",
-    "📊 Strategy Analysis": "You are a strategic digital marketing expert. Analyze marketing strategies and provide: strengths, weaknesses, opportunities, risks, ROI estimation, and 90-day action plan.",
-    "📱 Social Media Plan": "You are a social media marketing specialist. Create comprehensive social media strategies with platform selection, content calendar, posting frequency, engagement strategies, and metrics.",
-    "🔍 SEO Audit": "You are an SEO expert. Provide comprehensive SEO recommendations: on-page, technical, backlink strategy, keyword research, content optimization, and implementation roadmap.",
-    "💰 Budget Planning": "You are a marketing finance strategist. Create detailed budget allocation plans with percentages, justifications, ROI by channel, month-by-month breakdown, and contingency recommendations."
+    "💬 Chat": prompts.render("system.chat"),
+    "📊 Strategy Analysis": prompts.render("system.strategy"),
+    "📱 Social Media Plan": prompts.render("system.social"),
+    "🔍 SEO Audit": prompts.render("system.seo"),
+    "💰 Budget Planning": prompts.render("system.budget")
 }
 
 # Display chat
@@ -81,21 +115,38 @@ if user_input:
     # Get response
     with st.chat_message("assistant"):
         with st.spinner("Thinking..."):
+            session_lock = nullcontext()
+            if session_store is not None:
+                session_lock = session_store.lock(st.session_state.tenant_id)
             try:
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": system_prompts[mode]}
-                    ] + st.session_state.messages,
-                    temperature=temperature,
-                    max_tokens=800
-                )
+                with session_lock:
+                    if session_store is not None:
+                        # Another replica may have added turns since this page loaded
+                        st.session_state.messages = session_store.load(st.session_state.tenant_id) + [
+                            {"role": "user", "content": user_input}
+                        ]
+                    
+                    assistant_message = get_scheduler().run(
+                        backend.complete,
+                        [
+                            {"role": "system", "content": system_prompts[mode]}
+                        ] + st.session_state.messages,
+                        priority=INTERACTIVE if mode == "💬 Chat" else BATCH,
+                        tenant=st.session_state.tenant_id,
+                        temperature=temperature,
+                        max_tokens=800
+                    )
+                    
+                    if session_store is not None:
+                        session_store.append(st.session_state.tenant_id, [
+                            {"role": "user", "content": user_input},
+                            {"role": "assistant", "content": assistant_message}
+                        ])
+                    
+                    st.session_state.messages.append({"role": "assistant", "content": assistant_message})
                 
-                assistant_message = response.choices[0].message.content
                 st.write(assistant_message)
                 
-                st.session_state.messages.append({"role": "assistant", "content": assistant_message})
-                
             except Exception as e:
                 st.error(f"Error: {str(e)}")
                 st.session_state.messages.pop()
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from openai import OpenAI
+
+
+class BackendError(RuntimeError):
+    """Raised when no backend could serve a completion."""
+
+
+class CompletionBackend:
+    """Base class for chat completion backends."""
+
+    name = "backend"
+    # Last-resort backends are only used when every other backend is unhealthy
+    last_resort = False
+
+    def complete(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000, **kwargs) -> str:
+        """Return the assistant response for a list of chat messages."""
+        raise NotImplementedError
+
+    def stream(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000, **kwargs):
+        """Yield the assistant response as text deltas."""
+        yield self.complete(messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+
+class OpenAIBackend(CompletionBackend):
+    """The OpenAI API or any OpenAI-compatible HTTP server (e.g. a local model server)."""
+
+    def __init__(self, api_key: str = None, base_url: str = None, model: str = "gpt-3.5-turbo",
+                 name: str = "openai", timeout: float = 60.0):
+        self.name = name
+        self.model = model
+        # Local servers usually ignore the key but the client requires one
+        if not api_key and base_url:
+            api_key = "not-needed"
+        # FailoverBackend handles retries by moving on to the next backend
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+
+    def complete(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000, **kwargs) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **kwargs
+        )
+        return response.choices[0].message.content
+
+    def stream(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000, **kwargs):
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **kwargs
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+def _example_from_schema(schema: dict, key: str = "item"):
+    """Build a placeholder value matching a JSON schema."""
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {name: _example_from_schema(sub, name) for name, sub in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [_example_from_schema(schema.get("items", {}), key)]
+    if schema_type == "number":
+        return 0.0
+    return f"[{key}]"
+
+
+class StubBackend(CompletionBackend):
+    """A deterministic in-process backend for offline runs and tests.
+
+    The same messages always produce the same response. JSON mode requests
+    whose prompt contains a JSON schema line get a placeholder object matching it.
+    """
+
+    name = "stub"
+    last_resort = True
+
+    def complete(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000, **kwargs) -> str:
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+
+        if kwargs.get("response_format", {}).get("type") == "json_object":
+            for line in reversed(last_user.splitlines()):
+                if line.startswith('{"type":'):
+                    try:
+                        return json.dumps(_example_from_schema(json.loads(line)))
+                    except ValueError:
+                        break
+            return "{}"
+
+        digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()[:8]
+        topic = " ".join(last_user.split())[:80]
+        return f"[stub response {digest}] Recommendations for: {topic}"
+
+
+class FailoverBackend(CompletionBackend):
+    """Routes each call to the fastest healthy backend and fails over on errors.
+
+    Latency is the rolling average of the total duration of the last `window`
+    calls, streams included, counting only calls from the last `max_age`
+    seconds. A failed call counts as at least `failure_penalty` seconds, so a
+    backend that keeps failing quickly does not look fast. Once its samples
+    age out a backend counts as unmeasured and is probed again, so a
+    recovered backend can win back its traffic. A backend that fails
+    `failure_threshold` times in a row is moved behind the healthy ones for
+    `cooldown` seconds, but is still tried before any last-resort backend.
+    """
+
+    name = "failover"
+
+    def __init__(self, backends: list, window: int = 20, failure_threshold: int = 3, cooldown: float = 30.0,
+                 failure_penalty: float = 10.0, max_age: float = 60.0):
+        if not backends:
+            raise ValueError("FailoverBackend needs at least one backend")
+
+        self.backends = backends
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failure_penalty = failure_penalty
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._latencies = {b.name: deque(maxlen=window) for b in backends}    # (time, seconds)
+        self._failures = {b.name: 0 for b in backends}
+        self._unhealthy_until = {b.name: 0.0 for b in backends}
+
+    def _average_latency(self, backend: CompletionBackend, now: float) -> float:
+        latencies = [latency for measured, latency in self._latencies[backend.name] if now - measured <= self.max_age]
+        # Unmeasured (or no longer measured) backends sort first so they get probed
+        return sum(latencies) / len(latencies) if latencies else 0.0
+
+    def _candidates(self) -> list:
+        """Healthy backends fastest first, then unhealthy ones, then last-resort ones."""
+        now = time.monotonic()
+        with self._lock:
+            ranked = sorted(
+                enumerate(self.backends),
+                key=lambda item: (
+                    item[1].last_resort,
+                    self._unhealthy_until[item[1].name] > now,
+                    self._average_latency(item[1], now),
+                    item[0]
+                )
+            )
+        return [b for _, b in ranked]
+
+    def _record_success(self, backend: CompletionBackend, latency: float):
+        with self._lock:
+            self._latencies[backend.name].append((time.monotonic(), latency))
+            self._failures[backend.name] = 0
+            self._unhealthy_until[backend.name] = 0.0
+
+    def _record_failure(self, backend: CompletionBackend, elapsed: float):
+        with self._lock:
+            self._latencies[backend.name].append((time.monotonic(), max(elapsed, self.failure_penalty)))
+            self._failures[backend.name] += 1
+            if self._failures[backend.name] >= self.failure_threshold:
+                self._unhealthy_until[backend.name] = time.monotonic() + self.cooldown
+
+    def complete(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000, **kwargs) -> str:
+        errors = []
+        for backend in self._candidates():
+            start = time.monotonic()
+            try:
+                result = backend.complete(messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+            except Exception as e:
+                self._record_failure(backend, time.monotonic() - start)
+                errors.append(f"{backend.name}: {e}")
+                continue
+            self._record_success(backend, time.monotonic() - start)
+            return result
+        raise BackendError("All completion backends failed: " + "; ".join(errors))
+
+    def stream(self, messages: list, temperature: float = 0.7, max_tokens: int = 1000, **kwargs):
+        errors = []
+        for backend in self._candidates():
+            start = time.monotonic()
+            chunks = backend.stream(messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+            try:
+                first = next(chunks, "")
+            except Exception as e:
+                # Nothing has been sent to the caller yet, so try the next backend
+                self._record_failure(backend, time.monotonic() - start)
+                errors.append(f"{backend.name}: {e}")
+                continue
+
+            try:
+                yield first
+                yield from chunks
+            except GeneratorExit:
+                # The caller stopped reading, which says nothing about the backend
+                raise
+            except Exception:
+                self._record_failure(backend, time.monotonic() - start)
+                raise
+            self._record_success(backend, time.monotonic() - start)
+            return
+        raise BackendError("All completion backends failed: " + "; ".join(errors))
+
+    def health(self) -> list:
+        """Rolling latency and health state of every backend."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "healthy": self._unhealthy_until[b.name] <= now,
+                    "avg_latency_ms": round(1000 * self._average_latency(b, now), 1),
+                    "consecutive_failures": self._failures[b.name]
+                }
+                for b in self.backends
+            ]
+
+
+def build_backend(api_key: str = None, spec: str = None) -> CompletionBackend:
+    """Build the completion backend described by `spec` or COMPLETION_BACKENDS.
+
+    The spec is a comma-separated list of entries:
+      openai                          the OpenAI API (uses `api_key`)
+      stub                            the deterministic in-process backend
+      name=http://host:port/v1@model  an OpenAI-compatible server
+    With more than one entry a FailoverBackend is returned.
+    """
+    spec = spec or os.getenv("COMPLETION_BACKENDS", "openai")
+    backends = []
+    for entry in (e.strip() for e in spec.split(",")):
+        if not entry:
+            continue
+        if entry == "openai":
+            backends.append(OpenAIBackend(api_key=api_key))
+        elif entry == "stub":
+            backends.append(StubBackend())
+        elif "=" in entry:
+            name, url = entry.split("=", 1)
+            url, _, model = url.partition("@")
+            backends.append(OpenAIBackend(base_url=url, model=model or "gpt-3.5-turbo", name=name.strip()))
+        else:
+            raise ValueError(f"Unknown completion backend: '{entry}'")
+
+    if len(backends) == 1:
+        return backends[0]
+    return FailoverBackend(backends)
@@ -1,49 +1,29 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from completion_backends import build_backend
+from request_scheduler import INTERACTIVE, get_scheduler
+from prompt_registry import registry as prompts
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the OpenAI client only if being run directly
+# Initialize the completion backend only if being run directly
 api_key = os.getenv("OPENAI_API_KEY")
-if not api_key and __name__ == "__main__":
+backend_spec = os.getenv("COMPLETION_BACKENDS")
+if not api_key and not backend_spec and __name__ == "__main__":
     raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in your .env file or system environment.")
 
-client = None
-if api_key:
-    client = OpenAI(api_key=api_key)
+backend = None
+if api_key or backend_spec:
+    backend = build_backend(api_key)
 
 class DigitalMarketingConsultant:
     """A digital marketing consultancy bot powered by OpenAI."""
     
-    def __init__(self):
+    def __init__(self, completion_backend=None):
+        self.backend = completion_backend or backend
         self.conversation_history = []
-        self.system_prompt = """You are an expert digital marketing consultant with 15+ years of experience.
-        
-Your expertise includes:
-- Strategic digital marketing planning
-- SEO and SEM optimization
-- Social media marketing and management
-- Content marketing and strategy
-- Email marketing campaigns
-- PPC advertising (Google Ads, Facebook Ads)
-- Marketing analytics and data interpretation
-- Brand development and positioning
-- Customer acquisition and retention strategies
-- Marketing automation
-- Conversion rate optimization
-- Market research and competitor analysis
-
-When responding to clients:
-1. Provide specific, actionable recommendations
-2. Consider their budget, industry, and target audience
-3. Suggest data-driven metrics to track success
-4. Offer both short-term quick wins and long-term strategies
-5. Be practical and realistic about timelines and ROI
-6. Ask clarifying questions when needed to provide better advice
-
-Always maintain a professional, consultative tone while being approachable and encouraging."""
+        self.system_prompt = prompts.render("system.chat")
     
     def chat(self, user_message: str) -> str:
         """Send a message to the bot and get a response."""
@@ -53,22 +33,21 @@ Always maintain a professional, consultative tone while being approachable and e
             "content": user_message
         })
         
-        # Get response from OpenAI
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
+        # Get response from the completion backend once the scheduler admits the call
+        assistant_message = get_scheduler().run(
+            self.backend.complete,
+            [
                 {
                     "role": "system",
                     "content": self.system_prompt
                 }
             ] + self.conversation_history,
+            priority=INTERACTIVE,
+            tenant="cli",
             temperature=0.7,
             max_tokens=1000
         )
         
-        # Extract assistant response
-        assistant_message = response.choices[0].message.content
-        
         # Add assistant response to history
         self.conversation_history.append({
             "role": "assistant",
@@ -0,0 +1,329 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Approximate per-message overhead of the chat format, in tokens
+MESSAGE_OVERHEAD = 4
+
+# Token counts of recently seen message contents, keyed by content hash
+TOKEN_CACHE_SIZE = 4096
+
+_encoding = None
+_encoding_failed = tiktoken is None
+
+
+def _get_encoding():
+    """Load the tiktoken encoding on first use; it may need a download."""
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            _encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+        except Exception:
+            # Offline or unknown model: fall back to the estimate for good
+            _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when available, otherwise estimate them."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Roughly one token per word piece or punctuation mark
+    return len(re.findall(r"\w{1,4}|[^\w\s]", text))
+
+
+class PromptTemplate:
+    """A versioned prompt made of a byte-stable static part and a variable tail.
+
+    Only the variable tail is formatted, so every rendering of a template
+    starts with exactly the same characters and can hit the provider's
+    prompt cache.
+    """
+
+    def __init__(self, name: str, version: int, static: str, variable: str = ""):
+        self.name = name
+        self.version = version
+        self.static = static
+        self.variable = variable
+        self._static_tokens = None
+
+    @property
+    def static_tokens(self) -> int:
+        """Token count of the static part, computed on first use."""
+        if self._static_tokens is None:
+            self._static_tokens = count_tokens(self.static)
+        return self._static_tokens
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def render_variable(self, **values) -> str:
+        """Format only the variable tail of the template."""
+        return self.variable.format(**values)
+
+    def render(self, **values) -> str:
+        """Render the full prompt: the static part first, variable parts last."""
+        return self.static + self.render_variable(**values)
+
+
+class PromptRegistry:
+    """Central store of versioned prompt templates."""
+
+    def __init__(self, recent_requests: int = 16):
+        self._templates = {}    # name -> {version: PromptTemplate}
+        self._recent = deque(maxlen=recent_requests)    # requests as [(role, content hash, content)]
+        self._token_counts = OrderedDict()              # content hash -> tokens
+        self._lock = threading.Lock()
+
+    def _message_tokens(self, digest: str, content: str) -> int:
+        """Tokens of a message's content, tokenizing each distinct content once."""
+        with self._lock:
+            tokens = self._token_counts.get(digest)
+            if tokens is not None:
+                self._token_counts.move_to_end(digest)
+                return tokens
+        tokens = count_tokens(content)
+        with self._lock:
+            self._token_counts[digest] = tokens
+            while len(self._token_counts) > TOKEN_CACHE_SIZE:
+                self._token_counts.popitem(last=False)
+        return tokens
+
+    def register(self, name: str, version: int, static: str, variable: str = "") -> PromptTemplate:
+        versions = self._templates.setdefault(name, {})
+        if version in versions:
+            raise ValueError(f"Prompt {name}@v{version} is already registered")
+        template = PromptTemplate(name, version, static, variable)
+        versions[version] = template
+        return template
+
+    def get(self, name: str, version: int = None) -> PromptTemplate:
+        """Return a template, by default its latest version."""
+        versions = self._templates.get(name)
+        if not versions:
+            raise KeyError(f"Unknown prompt: {name}")
+        if version is None:
+            version = max(versions)
+        return versions[version]
+
+    def render(self, name: str, version: int = None, **values) -> str:
+        return self.get(name, version).render(**values)
+
+    def prefix_stats(self, messages: list) -> dict:
+        """Report how much of a request repeats the start of a recent request.
+
+        Providers cache exact prompt prefixes, so `cacheable_tokens` is the
+        longest common prefix with any of the last `recent_requests` requests
+        seen here. `template` and `template_tokens` name the longest
+        registered template the first message starts with.
+        """
+        if not messages:
+            return {"template": None, "template_tokens": 0, "cacheable_tokens": 0, "total_tokens": 0, "ratio": 0.0}
+
+        first = messages[0]["content"]
+        best = None
+        for versions in self._templates.values():
+            for template in versions.values():
+                if first.startswith(template.static) and (best is None or len(template.static) > len(best.static)):
+                    best = template
+        template_tokens = best.static_tokens + MESSAGE_OVERHEAD if best is not None else 0
+
+        # Messages are compared by content hash and counted from the cache,
+        # so only new contents and the one diverging message are tokenized
+        request = [
+            (m["role"], hashlib.sha1(m["content"].encode("utf-8")).hexdigest(), m["content"]) for m in messages
+        ]
+        message_tokens = [self._message_tokens(digest, content) + MESSAGE_OVERHEAD for _, digest, content in request]
+        total = sum(message_tokens)
+
+        with self._lock:
+            recent = list(self._recent)
+            self._recent.append(request)
+
+        # Longest run of identical leading messages with any recent request
+        matched = {}
+        for earlier in recent:
+            count = 0
+            for current, previous in zip(request, earlier):
+                if current[:2] != previous[:2]:
+                    break
+                count += 1
+            matched.setdefault(count, []).append(earlier)
+        cacheable = 0
+        if matched:
+            count = max(matched)
+            cacheable = sum(message_tokens[:count])
+            if count < len(request):
+                # Part of the first diverging message may still be shared
+                shared = max(
+                    (os.path.commonprefix([request[count][2], earlier[count][2]])
+                     for earlier in matched[count]
+                     if count < len(earlier) and earlier[count][0] == request[count][0]),
+                    key=len, default=""
+                )
+                if shared:
+                    shared_tokens = self._message_tokens(hashlib.sha1(shared.encode("utf-8")).hexdigest(), shared)
+                    cacheable += min(shared_tokens, message_tokens[count] - MESSAGE_OVERHEAD) + MESSAGE_OVERHEAD
+        return {
+            "template": best.key if best is not None else None,
+            "template_tokens": template_tokens,
+            "cacheable_tokens": cacheable,
+            "total_tokens": total,
+            "ratio": round(cacheable / total, 3) if total else 0.0
+        }
+
+
+registry = PromptRegistry()
+
+# Shared by every system prompt so all modes and entry points start with the
+# same bytes. Never edit it in place: register a new version instead.
+CONSULTANT_PERSONA = """You are an expert digital marketing consultant with 15+ years of experience.
+
+Your expertise includes:
+- Strategic digital marketing planning
+- SEO and SEM optimization
+- Social media marketing and management
+- Content marketing and strategy
+- Email marketing campaigns
+- PPC advertising (Google Ads, Facebook Ads)
+- Marketing analytics and data interpretation
+- Brand development and positioning
+- Customer acquisition and retention strategies
+- Marketing automation
+- Conversion rate optimization
+- Market research and competitor analysis
+- Growth hacking techniques
+- Influencer marketing
+- Video marketing strategy
+
+When responding:
+1. Provide specific, actionable recommendations
+2. Consider budget, industry, and target audience
+3. Suggest data-driven metrics to track success
+4. Offer both quick wins and long-term strategies
+5. Be practical about timelines and ROI expectations
+6. Ask clarifying questions when needed
+7. Provide examples and case studies when relevant
+
+Maintain a professional, consultative tone while being approachable."""
+
+# System prompts, one per consultation mode
+registry.register("system.chat", 1, CONSULTANT_PERSONA)
+
+registry.register("system.strategy", 1, CONSULTANT_PERSONA + """
+
+Current focus: strategy analysis. Analyze marketing strategies and provide:
+1. Strengths and weaknesses
+2. Opportunities for improvement
+3. Risks and mitigation strategies
+4. ROI estimation
+5. 90-day action plan
+Be data-driven and specific in your recommendations.""")
+
+registry.register("system.social", 1, CONSULTANT_PERSONA + """
+
+Current focus: social media planning. Create comprehensive social media strategies including:
+1. Platform selection and justification
+2. Content calendar overview
+3. Posting frequency and best times
+4. Content types and themes
+5. Engagement strategies
+6. Analytics metrics
+7. Budget allocation
+Provide actionable, specific recommendations.""")
+
+registry.register("system.seo", 1, CONSULTANT_PERSONA + """
+
+Current focus: SEO audits. Provide comprehensive SEO recommendations including:
+1. On-page SEO improvements
+2. Technical SEO fixes
+3. Backlink strategy
+4. Keyword research focus areas
+5. Content optimization priorities
+6. Local SEO recommendations
+7. Competitive analysis insights
+8. Implementation roadmap with timeline
+Be thorough and technical yet understandable.""")
+
+registry.register("system.budget", 1, CONSULTANT_PERSONA + """
+
+Current focus: budget planning. Create detailed budget allocation plans including:
+1. Recommended channel allocation (percentages and amounts)
+2. Justification for each allocation
+3. Expected ROI by channel
+4. Month-by-month breakdown
+5. Quick wins vs. long-term investments
+6. Contingency recommendations
+7. Key metrics to monitor per channel
+Provide realistic, data-backed recommendations.""")
+
+# Specialized reports: fixed instructions first, the client's details last
+registry.register("report.strategy", 1, """Please analyze the following marketing strategy and provide:
+1. Strengths
+2. Weaknesses
+3. Opportunities for improvement
+4. Potential risks
+5. ROI estimation
+6. 90-day action plan""", """
+
+Strategy Description:
+{strategy_description}""")
+
+registry.register("report.social", 1, """Create a comprehensive social media marketing plan with:
+1. Platform selection and justification
+2. Content calendar overview (30 days)
+3. Posting frequency and best times
+4. Content types and themes
+5. Engagement strategies
+6. Analytics metrics to track
+7. Budget allocation per platform""", """
+
+Industry: {industry}
+Target Audience: {audience}
+Monthly Budget: {budget}""")
+
+registry.register("report.funnel", 1, """Analyze the conversion funnel below and provide optimization recommendations:
+1. Identified bottlenecks
+2. Conversion rate improvement strategies
+3. A/B testing recommendations
+4. Landing page optimization tips
+5. Call-to-action improvements
+6. Implementation priority and timeline""", """
+
+Current Funnel:
+{funnel_description}""")
+
+registry.register("report.seo", 1, """Based on the website information below, provide comprehensive SEO recommendations including:
+1. On-page SEO improvements
+2. Technical SEO fixes
+3. Backlink strategy
+4. Keyword research focus areas
+5. Content optimization priorities
+6. Local SEO recommendations (if applicable)
+7. Competitive analysis insights
+8. Implementation roadmap with timeline and priority""", """
+
+Website Info:
+{website_info}""")
+
+registry.register("report.budget", 1, """Create a detailed budget allocation plan for the business below. Provide:
+1. Recommended channel allocation (percentages and amounts)
+2. Justification for each allocation
+3. Expected ROI by channel
+4. Month-by-month breakdown for first 90 days
+5. Quick wins vs. long-term investments
+6. Contingency recommendations
+7. Key metrics to monitor per channel""", """
+
+Total Budget: {total_budget}
+Business Goals: {goals}
+Industry: {industry}""")
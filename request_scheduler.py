@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Priority classes, lower value is served first
+INTERACTIVE = 0
+BATCH = 1
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    BATCH: "batch"
+}
+
+
+class QueueFullError(RuntimeError):
+    """Raised when admission control rejects a request because its queue is full."""
+
+
+class Ticket:
+    """A queued request waiting for (or holding) an execution slot."""
+
+    def __init__(self, priority: int, tenant: str):
+        self.priority = priority
+        self.tenant = tenant
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.granted = False
+
+    @property
+    def wait_time(self) -> float:
+        """Seconds spent in the queue before the slot was granted."""
+        if self.started is None:
+            return time.monotonic() - self.enqueued
+        return self.started - self.enqueued
+
+
+class RequestScheduler:
+    """Admits completion calls by priority class with per-tenant fair queuing.
+
+    At most `max_concurrency` calls run at once, and `reserved_interactive`
+    of those slots are never given to batch requests, so interactive turns
+    stay fast while a batch of reports is draining. Within a priority class
+    tenants are served round-robin. Requests beyond `max_queue_depth` for
+    their class are rejected with QueueFullError.
+    """
+
+    def __init__(self, max_concurrency: int = 4, reserved_interactive: int = 1, max_queue_depth: dict = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        # Batch requests always keep at least one slot, so a single-slot
+        # scheduler simply has nothing reserved
+        self.reserved_interactive = max(0, min(reserved_interactive, max_concurrency - 1))
+        self.max_queue_depth = max_queue_depth or {INTERACTIVE: 100, BATCH: 500}
+        self._cond = threading.Condition()
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}  # tenant -> deque of tickets
+        self._depth = {priority: 0 for priority in PRIORITY_NAMES}
+        self._active = {priority: 0 for priority in PRIORITY_NAMES}
+        self._completed = {priority: 0 for priority in PRIORITY_NAMES}
+        self._rejected = {priority: 0 for priority in PRIORITY_NAMES}
+        self._waits = {priority: deque(maxlen=500) for priority in PRIORITY_NAMES}
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE, tenant: str = "default"):
+        """Wait for an execution slot and hold it for the duration of the block."""
+        ticket = self._enqueue(priority, tenant)
+        try:
+            with self._cond:
+                while not ticket.granted:
+                    self._cond.wait()
+        except BaseException:
+            self._cancel(ticket)
+            raise
+
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def run(self, fn, *args, priority: int = INTERACTIVE, tenant: str = "default", **kwargs):
+        """Call `fn(*args, **kwargs)` once the scheduler admits it."""
+        with self.slot(priority, tenant):
+            return fn(*args, **kwargs)
+
+    def stats(self) -> dict:
+        """Queue depth, in-flight count and queue wait times per priority class."""
+        with self._cond:
+            result = {}
+            for priority, name in PRIORITY_NAMES.items():
+                waits = sorted(self._waits[priority])
+                result[name] = {
+                    "queued": self._depth[priority],
+                    "active": self._active[priority],
+                    "completed": self._completed[priority],
+                    "rejected": self._rejected[priority],
+                    "avg_wait_ms": round(1000 * sum(waits) / len(waits), 1) if waits else 0.0,
+                    "p95_wait_ms": round(1000 * waits[int(0.95 * (len(waits) - 1))], 1) if waits else 0.0
+                }
+            return result
+
+    def _enqueue(self, priority: int, tenant: str) -> Ticket:
+        if priority not in PRIORITY_NAMES:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        with self._cond:
+            if self._depth[priority] >= self.max_queue_depth[priority]:
+                self._rejected[priority] += 1
+                raise QueueFullError(
+                    f"The {PRIORITY_NAMES[priority]} queue is full, please try again shortly."
+                )
+            ticket = Ticket(priority, tenant)
+            self._queues[priority].setdefault(tenant, deque()).append(ticket)
+            self._depth[priority] += 1
+            self._dispatch()
+            return ticket
+
+    def _cancel(self, ticket: Ticket):
+        """Withdraw a ticket whose caller stopped waiting."""
+        with self._cond:
+            if ticket.granted:
+                self._release_locked(ticket)
+                return
+            tenants = self._queues[ticket.priority]
+            queue = tenants.get(ticket.tenant)
+            if queue and ticket in queue:
+                queue.remove(ticket)
+                self._depth[ticket.priority] -= 1
+                if not queue:
+                    del tenants[ticket.tenant]
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            self._release_locked(ticket)
+
+    def _release_locked(self, ticket: Ticket):
+        self._active[ticket.priority] -= 1
+        self._completed[ticket.priority] += 1
+        self._dispatch()
+
+    def _capacity(self, priority: int) -> int:
+        """Free slots available to a priority class."""
+        free = self.max_concurrency - sum(self._active.values())
+        if priority != INTERACTIVE:
+            batch_limit = self.max_concurrency - self.reserved_interactive
+            batch_active = sum(count for p, count in self._active.items() if p != INTERACTIVE)
+            free = min(free, batch_limit - batch_active)
+        return free
+
+    def _dispatch(self):
+        """Grant free slots to waiting tickets. Must be called with the lock held."""
+        granted = False
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            while tenants and self._capacity(priority) > 0:
+                # Round-robin: serve the first tenant, then move it to the back
+                tenant, queue = next(iter(tenants.items()))
+                ticket = queue.popleft()
+                if queue:
+                    tenants.move_to_end(tenant)
+                else:
+                    del tenants[tenant]
+
+                ticket.granted = True
+                ticket.started = time.monotonic()
+                self._depth[priority] -= 1
+                self._active[priority] += 1
+                self._waits[priority].append(ticket.wait_time)
+                granted = True
+        if granted:
+            self._cond.notify_all()
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Return the process-wide scheduler shared by all completion calls.
+
+    Admission is only coordinated between threads of this process; other
+    processes (CLI runs, Streamlit replicas) each have their own scheduler.
+    """
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler(
+                max_concurrency=int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "4")),
+                reserved_interactive=int(os.getenv("SCHEDULER_RESERVED_INTERACTIVE", "1")),
+                max_queue_depth={
+                    INTERACTIVE: int(os.getenv("SCHEDULER_MAX_INTERACTIVE_QUEUE", "100")),
+                    BATCH: int(os.getenv("SCHEDULER_MAX_BATCH_QUEUE", "500"))
+                }
+            )
+        return _default_scheduler
@@ -0,0 +1,309 @@
+import argparse
+import fnmatch
+import glob
+import gzip
+import json
+import os
+import re
+import tempfile
+from datetime import date, datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# One archive row per turn, so analytics jobs can read it without regrouping
+COLUMNS = ["session_id", "session_name", "session_created", "seq", "role", "content", "timestamp"]
+
+PARQUET_BATCH_ROWS = 5000
+
+class ArchiveError(ValueError):
+    """Raised when an archive's rows are not grouped and ordered by session."""
+
+
+# Session ids end up in file names, so imports only accept plain ones
+SESSION_ID_PATTERN = re.compile(r"[\w-]+")
+
+
+def _parse_date(value):
+    """Accept a date, a datetime or an ISO string; None stays None."""
+    if value is None or isinstance(value, date):
+        return value.date() if isinstance(value, datetime) else value
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def _matches(session: dict, since=None, until=None, name: str = None) -> bool:
+    """Check a session against the date range (inclusive) and name pattern.
+
+    Raises ValueError when a date range is given and the session's creation
+    date cannot be parsed.
+    """
+    if name is not None and not fnmatch.fnmatch(session.get("name", "").lower(), name.lower()):
+        return False
+    if since is None and until is None:
+        return True
+
+    created = session.get("created")
+    if not created:
+        return False
+    try:
+        created = datetime.fromisoformat(created).date()
+    except (TypeError, ValueError):
+        raise ValueError(f"malformed creation date: {created!r}")
+    if since is not None and created < since:
+        return False
+    if until is not None and created > until:
+        return False
+    return True
+
+
+def _select(sessions, since=None, until=None, name: str = None, skipped: list = None):
+    """Yield the (session_id, session) pairs that match the filters.
+
+    Sessions whose creation date cannot be parsed are left out and their ids
+    are appended to `skipped`, so one bad file does not abort a bulk run.
+    """
+    for session_id, session in sessions:
+        try:
+            matched = _matches(session, since, until, name)
+        except ValueError:
+            if skipped is not None:
+                skipped.append(session_id)
+            continue
+        if matched:
+            yield session_id, session
+
+
+def session_id_from_path(path: str) -> str:
+    """Recover the session id from a save_session file name (session_<id>.json)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem[len("session_"):] if stem.startswith("session_session_") else stem
+
+
+def iter_session_files(directory: str = ".", pattern: str = "session_*.json"):
+    """Yield (session_id, session) from saved session files, one file at a time."""
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        try:
+            with open(path, 'r') as f:
+                session = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        yield session.get("id") or session_id_from_path(path), session
+
+
+def iter_rows(sessions, since=None, until=None, name: str = None, skipped: list = None):
+    """Flatten (session_id, session) pairs into archive rows, one per turn."""
+    since, until = _parse_date(since), _parse_date(until)
+    for session_id, session in _select(sessions, since, until, name, skipped):
+        for seq, turn in enumerate(session.get("history", [])):
+            yield {
+                "session_id": session_id,
+                "session_name": session.get("name", ""),
+                "session_created": session.get("created", ""),
+                "seq": seq,
+                "role": turn.get("role", ""),
+                "content": turn.get("content", ""),
+                "timestamp": turn.get("timestamp", "")
+            }
+
+
+def _is_parquet(path: str) -> bool:
+    return path.endswith(".parquet")
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise RuntimeError("Parquet archives need pyarrow. Install it with: pip install pyarrow")
+
+
+def export_sessions(sessions, path: str, since=None, until=None, name: str = None, skipped: list = None) -> int:
+    """Stream sessions into a .jsonl, .jsonl.gz or .parquet archive.
+
+    `sessions` is any iterable of (session_id, session) pairs, e.g.
+    iter_session_files() or AdvancedMarketingConsultant.sessions.items().
+    Rows are written as they are produced, so memory use does not grow with
+    the number of sessions. Sessions without turns have no rows and are
+    skipped. Sessions with a malformed creation date are skipped when filtering
+    by date, and their ids are appended to `skipped`. Returns the number of
+    turns written.
+    """
+    # Bad dates must fail before anything is written
+    since, until = _parse_date(since), _parse_date(until)
+    rows = iter_rows(sessions, since, until, name, skipped)
+
+    # Write next to the target and swap it in at the end, so a failed export
+    # never leaves a truncated archive in place of an existing one
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".export-", dir=directory)
+    os.close(fd)
+    # mkstemp creates the file private to the user; archives are ordinary files
+    os.chmod(tmp_path, 0o644)
+    try:
+        count = _write_archive(rows, tmp_path, parquet=_is_parquet(path), compress=path.endswith(".gz"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return count
+
+
+def _write_archive(rows, path: str, parquet: bool, compress: bool) -> int:
+    count = 0
+    if parquet:
+        _require_pyarrow()
+        schema = pa.schema([
+            (column, pa.int64() if column == "seq" else pa.string()) for column in COLUMNS
+        ])
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+        try:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= PARQUET_BATCH_ROWS:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+        finally:
+            writer.close()
+        return count
+
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def _iter_archive_rows(path: str):
+    if _is_parquet(path):
+        _require_pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_ROWS):
+            yield from batch.to_pylist()
+        return
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_archive_sessions(path: str):
+    """Regroup archive rows into (session_id, session) pairs.
+
+    Rows must be grouped by session and ordered by turn, as export_sessions
+    writes them. Archives that were concatenated or re-sorted raise
+    ArchiveError instead of silently splitting or reordering sessions.
+    """
+    session_id, session = None, None
+    finished = set()
+    for row in _iter_archive_rows(path):
+        if row["session_id"] != session_id:
+            if session is not None:
+                finished.add(session_id)
+                yield session_id, session
+            session_id = row["session_id"]
+            if session_id in finished:
+                raise ArchiveError(f"Rows of session {session_id} are not contiguous in {path}")
+            session = {
+                "id": session_id,
+                "name": row["session_name"],
+                "created": row["session_created"],
+                "history": []
+            }
+        if row["seq"] != len(session["history"]):
+            raise ArchiveError(
+                f"Session {session_id} in {path} has turn {row['seq']} where turn "
+                f"{len(session['history'])} was expected"
+            )
+        session["history"].append({
+            "role": row["role"],
+            "content": row["content"],
+            "timestamp": row["timestamp"]
+        })
+    if session is not None:
+        yield session_id, session
+
+
+def iter_archive(path: str, since=None, until=None, name: str = None, skipped: list = None):
+    """Yield (session_id, session) pairs back from an archive, one session at a time.
+
+    Sessions come back in the save_session layout. Rows of one session are
+    contiguous in archives written by export_sessions; other archives raise
+    ArchiveError, possibly after earlier sessions were yielded. Call
+    check_archive() first to reject them before doing anything.
+    """
+    since, until = _parse_date(since), _parse_date(until)
+    yield from _select(_iter_archive_sessions(path), since, until, name, skipped)
+
+
+def check_archive(path: str) -> int:
+    """Read a whole archive to verify its ordering. Returns the number of sessions."""
+    return sum(1 for _ in _iter_archive_sessions(path))
+
+
+def import_to_directory(path: str, directory: str = ".", since=None, until=None, name: str = None,
+                        skipped: list = None) -> int:
+    """Restore archived sessions as session files. Returns the number of sessions.
+
+    Sessions whose id is not made of letters, digits, '_' and '-' would write
+    outside `directory`, so they are not restored and go to `skipped`.
+    The archive is checked first, so a malformed one writes no files.
+    """
+    check_archive(path)
+    count = 0
+    for session_id, session in iter_archive(path, since, until, name, skipped):
+        if not isinstance(session_id, str) or not SESSION_ID_PATTERN.fullmatch(session_id):
+            if skipped is not None:
+                skipped.append(str(session_id))
+            continue
+        with open(os.path.join(directory, f"session_{session_id}.json"), 'w') as f:
+            json.dump(session, f, indent=2)
+        count += 1
+    return count
+
+
+def main():
+    """Command line entry point for bulk export and import."""
+    parser = argparse.ArgumentParser(description="Bulk export and import of saved consultation sessions.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for command, help_text in [("export", "Export session files to an archive"),
+                               ("import", "Restore session files from an archive")]:
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument("archive", help="Archive path (.jsonl, .jsonl.gz or .parquet)")
+        sub.add_argument("--dir", default=".", help="Directory of the session files")
+        sub.add_argument("--since", type=date.fromisoformat,
+                         help="Only sessions created on or after this date (YYYY-MM-DD)")
+        sub.add_argument("--until", type=date.fromisoformat,
+                         help="Only sessions created on or before this date (YYYY-MM-DD)")
+        sub.add_argument("--name", help="Only sessions whose name matches this pattern, e.g. 'acme*'")
+
+    args = parser.parse_args()
+    skipped = []
+    if args.command == "export":
+        count = export_sessions(iter_session_files(args.dir), args.archive, args.since, args.until, args.name, skipped)
+        print(f"✓ Exported {count} turns to {args.archive}")
+    else:
+        try:
+            count = import_to_directory(args.archive, args.dir, args.since, args.until, args.name, skipped)
+        except ArchiveError as e:
+            raise SystemExit(f"❌ {e}")
+        print(f"✓ Imported {count} sessions into {args.dir}")
+    if skipped:
+        print(f"⚠ Skipped {len(skipped)} sessions with a malformed creation date or id: {', '.join(skipped)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import glob
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from session_archive import session_id_from_path
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "our", "so", "that",
+    "the", "this", "to", "we", "what", "with", "you", "your"
+}
+
+
+def _stem(term: str) -> str:
+    """Fold simple plurals so "newsletters" matches "newsletter"."""
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def tokenize(text: str) -> list:
+    """Split text into lowercase search terms, dropping stop words."""
+    return [_stem(t) for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS]
+
+
+class SessionIndex:
+    """A BM25 inverted index over the turns of consultation sessions.
+
+    Each turn is one document. Turns can be added one at a time as they are
+    recorded, and saved session files are re-indexed only when they change.
+    The index is safe to share between threads. With `max_sessions`, the
+    least recently updated sessions are evicted beyond that many.
+    """
+
+    def __init__(self, directory: str = ".", pattern: str = "session_*.json", k1: float = 1.5, b: float = 0.75,
+                 max_sessions: int = None):
+        self.directory = directory
+        self.pattern = pattern
+        self.k1 = k1
+        self.b = b
+        self.max_sessions = max_sessions
+        self._lock = threading.RLock()
+        self.postings = defaultdict(dict)    # term -> {doc_id: term frequency}
+        self.documents = {}                  # doc_id -> turn metadata
+        self.doc_terms = {}                  # doc_id -> Counter of terms
+        self.doc_lengths = {}                # doc_id -> number of terms
+        self.total_length = 0
+        self._session_docs = OrderedDict()    # session_id -> doc ids, least recently updated first
+        self._file_mtimes = {}                # path -> (mtime, session_id)
+        self._next_doc_id = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.documents)
+
+    def turn_count(self, session_id: str) -> int:
+        """Number of indexed turns of a session."""
+        with self._lock:
+            return len(self._session_docs.get(session_id, []))
+
+    def add_turn(self, session_id: str, session_name: str, turn: dict) -> int:
+        """Index a single turn of a session and return its document id."""
+        terms = Counter(tokenize(turn.get("content", "")))
+        with self._lock:
+            doc_id = self._add_document(session_id, session_name, turn, terms)
+            self._evict(keep=session_id)
+            return doc_id
+
+    def _add_document(self, session_id: str, session_name: str, turn: dict, terms: Counter) -> int:
+        doc_id = self._next_doc_id
+        self._next_doc_id += 1
+
+        self.documents[doc_id] = {
+            "session_id": session_id,
+            "session_name": session_name,
+            "role": turn.get("role", ""),
+            "content": turn.get("content", ""),
+            "timestamp": turn.get("timestamp", "")
+        }
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+        for term, count in terms.items():
+            self.postings[term][doc_id] = count
+        self._session_docs.setdefault(session_id, []).append(doc_id)
+        self._session_docs.move_to_end(session_id)
+        return doc_id
+
+    def _evict(self, keep: str):
+        """Drop the least recently updated sessions beyond `max_sessions`."""
+        if self.max_sessions is None:
+            return
+        while len(self._session_docs) > self.max_sessions:
+            oldest = next(iter(self._session_docs))
+            if oldest == keep:
+                break
+            self._remove_session(oldest)
+            # Let refresh() pick the file up again if it changes
+            for path in [p for p, (_, sid) in self._file_mtimes.items() if sid == oldest]:
+                del self._file_mtimes[path]
+
+    def remove_session(self, session_id: str):
+        """Drop every indexed turn of a session."""
+        with self._lock:
+            self._remove_session(session_id)
+
+    def _remove_session(self, session_id: str):
+        for doc_id in self._session_docs.pop(session_id, []):
+            terms = self.doc_terms.pop(doc_id)
+            self.total_length -= self.doc_lengths.pop(doc_id)
+            for term in terms:
+                postings = self.postings[term]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+            del self.documents[doc_id]
+
+    def index_session(self, session_id: str, session: dict):
+        """(Re)index all turns of a session, replacing any previous version."""
+        turns = [(turn, Counter(tokenize(turn.get("content", "")))) for turn in session.get("history", [])]
+        with self._lock:
+            self._remove_session(session_id)
+            for turn, terms in turns:
+                self._add_document(session_id, session.get("name", ""), turn, terms)
+            self._evict(keep=session_id)
+
+    def refresh(self) -> int:
+        """Index new or modified session files in the directory.
+
+        Returns the number of files that were (re)indexed.
+        """
+        updated = 0
+        for path in glob.glob(os.path.join(self.directory, self.pattern)):
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            with self._lock:
+                if self._file_mtimes.get(path, (None, None))[0] == mtime:
+                    continue
+
+            try:
+                with open(path, 'r') as f:
+                    session = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+
+            session_id = session.get("id") or session_id_from_path(path)
+            with self._lock:
+                self.index_session(session_id, session)
+                self._file_mtimes[path] = (mtime, session_id)
+            updated += 1
+        return updated
+
+    def search(self, query: str, k: int = 5, session_ids=None) -> list:
+        """Return the top-k turns for a query, best match first.
+
+        With `session_ids`, only turns of those sessions are considered.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self.documents:
+                return []
+
+            allowed = None
+            if session_ids is not None:
+                allowed = {doc_id for session_id in session_ids for doc_id in self._session_docs.get(session_id, [])}
+                if not allowed:
+                    return []
+
+            doc_count = len(self.documents)
+            avg_length = self.total_length / doc_count or 1
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [dict(self.documents[doc_id], score=round(score, 4)) for doc_id, score in ranked]
+
+
+def build_context_messages(index: SessionIndex, query: str, k: int, recent_messages: list, session_ids=None) -> list:
+    """Build prompt messages from the top-k relevant prior turns plus the recent ones.
+
+    Used instead of resending the whole conversation history. `session_ids`
+    limits retrieval to the turns of those sessions.
+    """
+    recent_contents = {message["content"] for message in recent_messages}
+    results = [
+        r for r in index.search(query, k + len(recent_messages), session_ids)
+        if r["content"] not in recent_contents
+    ][:k]
+
+    messages = []
+    if results:
+        excerpts = "\n\n".join(
+            f"[{r['session_name'] or r['session_id']} - {r['role']}]\n{r['content']}" for r in results
+        )
+        messages.append({
+            "role": "system",
+            "content": f"Relevant excerpts from earlier consultations:\n\n{excerpts}"
+        })
+    return messages + [{"role": m["role"], "content": m["content"]} for m in recent_messages]
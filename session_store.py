@@ -0,0 +1,188 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class SessionLockTimeout(RuntimeError):
+    """Raised when a session stays locked by another request for too long."""
+
+
+class SessionStore:
+    """Conversation state shared between processes through a SQLite file.
+
+    Turns are appended one at a time, and loading a session only fetches the
+    turns that are newer than the ones in the small in-process cache. Any
+    number of Streamlit replicas can point at the same file.
+    """
+
+    def __init__(self, path: str = "sessions.db", cache_size: int = 256, lock_ttl: float = 30.0):
+        self.path = path
+        self.cache_size = cache_size
+        self.lock_ttl = lock_ttl
+        self._local = threading.local()
+        self._cache = OrderedDict()    # session_id -> (messages, timestamp of the last one)
+        self._cache_lock = threading.Lock()
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS turns (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            PRIMARY KEY (session_id, seq)
+        )""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS session_locks (
+            session_id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        )""")
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; transactions are managed explicitly."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str) -> list:
+        """Return the messages of a session, fetching only turns not yet cached."""
+        with self._cache_lock:
+            cached, last_timestamp = self._cache.get(session_id, ([], None))
+            cached = list(cached)
+
+        # Re-read the last cached turn too, to detect a session that was
+        # cleared or rewritten by another process since it was cached
+        conn = self._connection()
+        rows = conn.execute(
+            "SELECT role, content, timestamp FROM turns WHERE session_id = ? AND seq >= ? ORDER BY seq",
+            (session_id, max(len(cached) - 1, 0))
+        ).fetchall()
+        if cached:
+            if not rows or rows[0][2] != last_timestamp:
+                cached = []
+                rows = conn.execute(
+                    "SELECT role, content, timestamp FROM turns WHERE session_id = ? ORDER BY seq",
+                    (session_id,)
+                ).fetchall()
+            else:
+                rows = rows[1:]
+
+        messages = cached + [{"role": role, "content": content} for role, content, _ in rows]
+        if rows:
+            last_timestamp = rows[-1][2]
+        elif not cached:
+            last_timestamp = None
+
+        with self._cache_lock:
+            self._cache[session_id] = (messages, last_timestamp)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(messages)
+
+    def append(self, session_id: str, messages: list):
+        """Append turns to a session in a single transaction."""
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the database write lock, so concurrent
+        # writers in other processes cannot pick the same sequence numbers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            next_seq = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            rows = [
+                (session_id, next_seq + i, m["role"], m["content"], datetime.now().isoformat())
+                for i, m in enumerate(messages)
+            ]
+            conn.executemany(
+                "INSERT INTO turns (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._cache_lock:
+            # Only extend the cache when it is exactly up to date
+            if session_id in self._cache and rows:
+                cached, _ = self._cache[session_id]
+                if len(cached) == next_seq:
+                    cached = cached + [{"role": m["role"], "content": m["content"]} for m in messages]
+                    self._cache[session_id] = (cached, rows[-1][4])
+
+    def clear(self, session_id: str):
+        """Delete every turn of a session."""
+        self._connection().execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+        with self._cache_lock:
+            self._cache.pop(session_id, None)
+
+    @contextmanager
+    def lock(self, session_id: str, timeout: float = 60.0):
+        """Hold an exclusive lock on a session across threads and processes.
+
+        The lock is a lease in the database that expires after `lock_ttl`
+        seconds, so a crashed replica cannot block a session forever. While
+        the lock is held a background thread renews the lease every third of
+        `lock_ttl`, so slow completions do not lose it mid-turn.
+        """
+        owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        conn = self._connection()
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT expires FROM session_locks WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                acquired = row is None or row[0] < now
+                if acquired:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO session_locks (session_id, owner, expires) VALUES (?, ?, ?)",
+                        (session_id, owner, now + self.lock_ttl)
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            if acquired:
+                break
+            if time.monotonic() > deadline:
+                raise SessionLockTimeout(f"Session {session_id} is busy, please try again shortly.")
+            time.sleep(0.05)
+
+        released = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._renew_lease, args=(session_id, owner, released), daemon=True
+        )
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            released.set()
+            heartbeat.join()
+            conn.execute(
+                "DELETE FROM session_locks WHERE session_id = ? AND owner = ?", (session_id, owner)
+            )
+
+    def _renew_lease(self, session_id: str, owner: str, released: threading.Event):
+        """Push the lease expiry forward until the lock is released."""
+        conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        try:
+            while not released.wait(self.lock_ttl / 3):
+                conn.execute(
+                    "UPDATE session_locks SET expires = ? WHERE session_id = ? AND owner = ?",
+                    (time.time() + self.lock_ttl, session_id, owner)
+                )
+        finally:
+            conn.close()
@@ -1,6 +1,12 @@
 import os
+import uuid
+from contextlib import nullcontext
 import streamlit as st
-from openai import OpenAI
+from completion_backends import FailoverBackend, build_backend
+from request_scheduler import BATCH, INTERACTIVE, get_scheduler
+from session_index import SessionIndex, build_context_messages
+from session_store import SessionStore
+from prompt_registry import registry as prompts
 
 # Set page config FIRST before any other streamlit commands
 st.set_page_config(
@@ -31,6 +37,10 @@ if "messages" not in st.session_state:
 if "api_key_valid" not in st.session_state:
     st.session_state.api_key_valid = False
 
+# Identifies this browser session to the request scheduler and session store
+if "tenant_id" not in st.session_state:
+    st.session_state.tenant_id = uuid.uuid4().hex
+
 # Get API key from environment or secrets
 api_key = None
 try:
@@ -38,7 +48,7 @@ try:
 except (FileNotFoundError, KeyError):
     api_key = os.getenv("OPENAI_API_KEY")
 
-if not api_key:
+if not api_key and not os.getenv("COMPLETION_BACKENDS"):
     st.error("❌ API Key Error")
     st.markdown("""
     ### Missing OpenAI API Key
@@ -62,14 +72,62 @@ if not api_key:
     """)
     st.stop()
 
+@st.cache_resource
+def get_backend(api_key):
+    """Share one completion backend (and its health tracking) across all users."""
+    return build_backend(api_key)
+
 try:
-    client = OpenAI(api_key=api_key)
+    backend = get_backend(api_key)
     st.session_state.api_key_valid = True
 except Exception as e:
     st.error(f"❌ API Configuration Error: {str(e)}")
     st.markdown(f"**Error details:** {str(e)}")
     st.stop()
 
+@st.cache_resource
+def get_session_index():
+    """One in-process index of chat turns, keyed by each visitor's tenant id.
+
+    Only the most recently active conversations stay indexed; an evicted
+    visitor's turns are re-indexed by sync_session_index() on their next run.
+    """
+    return SessionIndex(max_sessions=int(os.getenv("SESSION_INDEX_MAX_SESSIONS", "256")))
+
+session_index = get_session_index()
+
+@st.cache_resource
+def get_session_store(path):
+    """Share one session store (and its read cache) across all users."""
+    return SessionStore(path)
+
+# External state mode: conversations live in a shared SQLite file keyed by the
+# ?session= URL parameter, so any replica can serve any user after a restart
+session_store = None
+store_path = os.getenv("SESSION_STORE_PATH")
+if store_path:
+    session_store = get_session_store(store_path)
+    params = st.experimental_get_query_params()
+    if "session" in params:
+        st.session_state.tenant_id = params["session"][0]
+    else:
+        st.experimental_set_query_params(session=st.session_state.tenant_id)
+    st.session_state.messages = session_store.load(st.session_state.tenant_id)
+
+def sync_session_index():
+    """Index this visitor's turns that are not indexed yet, under their tenant id."""
+    tenant_id = st.session_state.tenant_id
+    messages = st.session_state.messages
+    indexed = session_index.turn_count(tenant_id)
+    if indexed > len(messages):
+        # The chat was cleared, possibly by another replica
+        session_index.remove_session(tenant_id)
+        indexed = 0
+    for turn in messages[indexed:]:
+        session_index.add_turn(tenant_id, "", turn)
+
+sync_session_index()
+
 # Header
 st.markdown("# 🎯 Digital Marketing Consultancy Bot")
 st.markdown("*Powered by OpenAI GPT-3.5-turbo*")
@@ -102,8 +160,53 @@ with st.sidebar:
     
     if st.button("🗑️ Clear Chat History"):
         st.session_state.messages = []
+        if session_store is not None:
+            session_store.clear(st.session_state.tenant_id)
+        session_index.remove_session(st.session_state.tenant_id)
         st.success("Chat history cleared!")
     
+    st.markdown("---")
+    st.markdown("## 🔎 Search Your Conversation")
+    
+    # Only this visitor's own turns are searchable
+    search_query = st.text_input("Search earlier messages:")
+    if search_query:
+        results = session_index.search(search_query, k=5, session_ids=[st.session_state.tenant_id])
+        if not results:
+            st.caption("No matching turns found.")
+        for result in results:
+            with st.expander(f"{result['role'].title()} message"):
+                st.markdown(result["content"])
+    
+    use_retrieval = st.checkbox(
+        "Use relevant earlier turns instead of full history",
+        help="Send only the most relevant earlier turns of this conversation and the latest messages"
+    )
+    retrieval_k = 3
+    if use_retrieval:
+        retrieval_k = st.slider("Past turns to include:", min_value=1, max_value=10, value=3)
+    
+    with st.expander("📈 Request Queue"):
+        if "last_queue_wait" in st.session_state:
+            st.caption(f"Your last request waited {st.session_state.last_queue_wait * 1000:.0f} ms in the queue.")
+        if "last_prompt_stats" in st.session_state:
+            stats = st.session_state.last_prompt_stats
+            st.caption(
+                f"Cacheable prompt prefix: {stats['ratio']:.0%} "
+                f"({stats['cacheable_tokens']}/{stats['total_tokens']} tokens)"
+            )
+        for name, stats in get_scheduler().stats().items():
+            st.markdown(
+                f"**{name.title()}**: {stats['queued']} queued, {stats['active']} running, "
+                f"avg wait {stats['avg_wait_ms']} ms, p95 {stats['p95_wait_ms']} ms"
+            )
+    
+    if isinstance(backend, FailoverBackend):
+        with st.expander("🩺 Backend Health"):
+            for health in backend.health():
+                status = "🟢" if health["healthy"] else "🔴"
+                st.markdown(f"{status} **{health['name']}**: {health['avg_latency_ms']} ms avg latency")
+    
     st.markdown("---")
     st.markdown("""
     ### 📖 About This Bot
@@ -117,52 +220,20 @@ with st.sidebar:
     - And much more!
     """)
 
-# System prompts for different modes
+# System prompts for different modes, from the shared prompt registry
 system_prompts = {
-    "💬 Chat": """You are an expert digital marketing consultant with 15+ years of experience.
-Provide specific, actionable recommendations tailored to the user's situation.
-Be professional yet approachable. Ask clarifying questions when needed.""",
-    
-    "📊 Strategy Analysis": """You are a strategic digital marketing expert. Analyze marketing strategies and provide:
-1. Strengths and weaknesses
-2. Opportunities for improvement
-3. Risks and mitigation strategies
-4. ROI estimation
-5. 90-day action plan
-Be data-driven and specific in your recommendations.""",
-    
-    "📱 Social Media Plan": """You are a social media marketing specialist. Create comprehensive social media strategies including:
-1. Platform selection and justification
-2. Content calendar overview
-3. Posting frequency and best times
-4. Content types and themes
-5. Engagement strategies
-6. Analytics metrics
-7. Budget allocation
-Provide actionable, specific recommendations.""",
-    
-    "🔍 SEO Audit": """You are an SEO expert. Provide comprehensive SEO recommendations including:
-1. On-page SEO improvements
-2. Technical SEO fixes
-3. Backlink strategy
-4. Keyword research focus areas
-5. Content optimization priorities
-6. Local SEO recommendations
-7. Competitive analysis insights
-8. Implementation roadmap with timeline
-Be thorough and technical yet understandable.""",
-    
-    "💰 Budget Planning": """You are a marketing finance strategist. Create detailed budget allocation plans including:
-1. Recommended channel allocation (percentages and amounts)
-2. Justification for each allocation
-3. Expected ROI by channel
-4. Month-by-month breakdown
-5. Quick wins vs. long-term investments
-6. Contingency recommendations
-7. Key metrics to monitor per channel
-Provide realistic, data-backed recommendations."""
+    "💬 Chat": prompts.render("system.chat"),
+    "📊 Strategy Analysis": prompts.render("system.strategy"),
+    "📱 Social Media Plan": prompts.render("system.social"),
+    "🔍 SEO Audit": prompts.render("system.seo"),
+    "💰 Budget Planning": prompts.render("system.budget")
 }
 
+# Chat turns are interactive; the long report modes queue as batch work so
+# they cannot take the slots reserved for chat
+priorities = {name: BATCH for name in system_prompts}
+priorities["💬 Chat"] = INTERACTIVE
+
 # Display chat messages
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
@@ -182,33 +253,59 @@ if user_input:
     with st.chat_message("user"):
         st.markdown(user_input)
     
-    # Get response from OpenAI
+    # Get response from the completion backend
     with st.chat_message("assistant"):
         with st.spinner("🤖 Thinking..."):
+            session_lock = nullcontext()
+            if session_store is not None:
+                session_lock = session_store.lock(st.session_state.tenant_id)
             try:
-                # Prepare messages for API
-                messages_for_api = [
-                    {"role": "system", "content": system_prompts[mode]}
-                ] + st.session_state.messages
-                
-                # Call OpenAI API
-                response = client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=messages_for_api,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-                
-                # Extract and display response
-                assistant_message = response.choices[0].message.content
+                with session_lock:
+                    if session_store is not None:
+                        # Another replica may have added turns since this page loaded
+                        st.session_state.messages = session_store.load(st.session_state.tenant_id) + [
+                            {"role": "user", "content": user_input}
+                        ]
+                    
+                    # Prepare messages for API
+                    if use_retrieval:
+                        history = build_context_messages(
+                            session_index, user_input, retrieval_k, st.session_state.messages[-3:],
+                            session_ids=[st.session_state.tenant_id]
+                        )
+                    else:
+                        history = st.session_state.messages
+                    messages_for_api = [
+                        {"role": "system", "content": system_prompts[mode]}
+                    ] + history
+                    st.session_state.last_prompt_stats = prompts.prefix_stats(messages_for_api)
+                    
+                    # Call the completion backend once the shared scheduler admits the request
+                    with get_scheduler().slot(priorities[mode], st.session_state.tenant_id) as ticket:
+                        assistant_message = backend.complete(
+                            messages_for_api,
+                            temperature=temperature,
+                            max_tokens=max_tokens
+                        )
+                    st.session_state.last_queue_wait = ticket.wait_time
+                    
+                    # Persist this turn for the other replicas
+                    if session_store is not None:
+                        session_store.append(st.session_state.tenant_id, [
+                            {"role": "user", "content": user_input},
+                            {"role": "assistant", "content": assistant_message}
+                        ])
+                    
+                    # Add assistant message to session state
+                    st.session_state.messages.append({
+                        "role": "assistant",
+                        "content": assistant_message
+                    })
+                    sync_session_index()
+
+                # Display response
                 st.markdown(assistant_message)
                 
-                # Add assistant message to session state
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": assistant_message
-                })
-                
             except Exception as e:
                 error_msg = f"❌ Error: {str(e)}"
                 st.error(error_msg)
@@ -0,0 +1,279 @@
+import json
+from dataclasses import dataclass, fields, is_dataclass, asdict
+from typing import List, get_type_hints, get_origin, get_args
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a structured report still has invalid sections after retries."""
+
+
+# Typed records used inside the reports
+
+@dataclass
+class ActionItem:
+    action: str
+    timeline: str
+    priority: str
+
+
+@dataclass
+class PlatformPlan:
+    platform: str
+    justification: str
+    posting_frequency: str
+    best_times: str
+    budget_percentage: float
+
+
+@dataclass
+class ChannelAllocation:
+    channel: str
+    percentage: float
+    amount: float
+    justification: str
+    expected_roi: str
+
+
+@dataclass
+class MonthlyBudget:
+    month: str
+    focus: str
+    spend: float
+
+
+# One report per specialized method of AdvancedMarketingConsultant
+
+@dataclass
+class StrategyReport:
+    strengths: List[str]
+    weaknesses: List[str]
+    opportunities: List[str]
+    risks: List[str]
+    roi_estimate: str
+    action_plan_90_day: List[ActionItem]
+
+
+@dataclass
+class SocialMediaPlan:
+    platforms: List[PlatformPlan]
+    content_calendar: List[str]
+    content_themes: List[str]
+    engagement_strategies: List[str]
+    metrics: List[str]
+
+
+@dataclass
+class FunnelReport:
+    bottlenecks: List[str]
+    improvement_strategies: List[str]
+    ab_tests: List[str]
+    landing_page_tips: List[str]
+    cta_improvements: List[str]
+    implementation_plan: List[ActionItem]
+
+
+@dataclass
+class SEOReport:
+    on_page: List[str]
+    technical: List[str]
+    backlink_strategy: List[str]
+    keyword_focus: List[str]
+    content_priorities: List[str]
+    local_seo: List[str]
+    competitive_insights: List[str]
+    roadmap: List[ActionItem]
+
+
+@dataclass
+class BudgetReport:
+    channel_allocations: List[ChannelAllocation]
+    monthly_breakdown: List[MonthlyBudget]
+    quick_wins: List[str]
+    long_term_investments: List[str]
+    contingency: List[str]
+    metrics: List[str]
+
+
+# JSON response format requested from the API. gpt-3.5-turbo only supports
+# JSON mode, so the schema itself is embedded in the prompt.
+RESPONSE_FORMAT = {"type": "json_object"}
+
+
+def _type_schema(tp) -> dict:
+    """Build the JSON schema for a single field type."""
+    if tp is str:
+        return {"type": "string"}
+    if tp is float:
+        return {"type": "number"}
+    if get_origin(tp) in (list, List):
+        return {"type": "array", "items": _type_schema(get_args(tp)[0])}
+    if is_dataclass(tp):
+        return json_schema(tp)
+    raise TypeError(f"Unsupported field type: {tp!r}")
+
+
+def json_schema(record_cls, only=None) -> dict:
+    """Build the JSON schema for a record class, optionally limited to some fields."""
+    hints = get_type_hints(record_cls)
+    names = [f.name for f in fields(record_cls) if only is None or f.name in only]
+    return {
+        "type": "object",
+        "properties": {name: _type_schema(hints[name]) for name in names},
+        "required": names,
+        "additionalProperties": False
+    }
+
+
+def _coerce(tp, value):
+    """Convert a decoded JSON value to the declared type or raise ValueError."""
+    if tp is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise ValueError(f"expected string, got {type(value).__name__}")
+    if tp is float:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str):
+            # Models often answer "25%" or "$12,500" for numeric fields
+            return float(value.strip().strip("$%").replace(",", ""))
+        raise ValueError(f"expected number, got {type(value).__name__}")
+    if get_origin(tp) in (list, List):
+        if not isinstance(value, list):
+            raise ValueError(f"expected array, got {type(value).__name__}")
+        item_type = get_args(tp)[0]
+        return [_coerce(item_type, item) for item in value]
+    if is_dataclass(tp):
+        if not isinstance(value, dict):
+            raise ValueError(f"expected object, got {type(value).__name__}")
+        hints = get_type_hints(tp)
+        missing = [f.name for f in fields(tp) if f.name not in value]
+        if missing:
+            raise ValueError(f"missing keys: {', '.join(missing)}")
+        return tp(**{f.name: _coerce(hints[f.name], value[f.name]) for f in fields(tp)})
+    raise TypeError(f"Unsupported field type: {tp!r}")
+
+
+def parse_section(report_cls, name: str, value):
+    """Validate one top-level section of a report, returning its typed value."""
+    hints = get_type_hints(report_cls)
+    if name not in hints:
+        raise ValueError(f"unknown section '{name}'")
+    return _coerce(hints[name], value)
+
+
+def parse_sections(report_cls, raw: str, only=None):
+    """Parse a raw JSON response into typed sections.
+
+    Returns a tuple of (valid sections, names of missing or invalid sections).
+    Truncated responses keep every section that was completed before the cut.
+    """
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            data = {}
+    except json.JSONDecodeError:
+        parser = SectionStreamParser()
+        data = dict(parser.feed(raw))
+
+    expected = [f.name for f in fields(report_cls) if only is None or f.name in only]
+    sections = {}
+    invalid = []
+    for name in expected:
+        if name not in data:
+            invalid.append(name)
+            continue
+        try:
+            sections[name] = parse_section(report_cls, name, data[name])
+        except ValueError:
+            invalid.append(name)
+    return sections, invalid
+
+
+class SectionStreamParser:
+    """Incrementally extracts completed top-level members of a streamed JSON object."""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = None
+
+    def feed(self, text: str) -> list:
+        """Add streamed text and return the (key, value) pairs completed by it."""
+        self._buffer += text
+        completed = []
+        buffer = self._buffer
+        for pos in range(self._pos, len(buffer)):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = pos + 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._close_member(pos))
+            elif char == "," and self._depth == 1:
+                completed.extend(self._close_member(pos))
+                self._member_start = pos + 1
+        self._pos = len(buffer)
+        return completed
+
+    def _close_member(self, end: int) -> list:
+        """Decode the member between the last separator and `end`."""
+        if self._member_start is None:
+            return []
+        member = self._buffer[self._member_start:end].strip()
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except json.JSONDecodeError:
+            return []
+
+
+def build_request(instructions: str, report_cls, inputs: str = "") -> str:
+    """Add the JSON output instructions for a report to a prompt.
+
+    The schema goes between the fixed instructions and the client's inputs so
+    that everything before the inputs stays identical between requests.
+    """
+    schema = json.dumps(json_schema(report_cls), separators=(",", ":"))
+    return f"""{instructions}
+
+Respond ONLY with a JSON object matching this JSON schema, with the keys in the order given:
+{schema}{inputs}"""
+
+
+def build_repair_request(report_cls, invalid: list) -> str:
+    """Ask the model to re-emit only the sections that failed validation."""
+    schema = json.dumps(json_schema(report_cls, only=invalid), separators=(",", ":"))
+    return f"""The following sections of your JSON response were missing or invalid: {', '.join(invalid)}.
+Respond ONLY with a JSON object containing just these sections, matching this JSON schema:
+{schema}"""
+
+
+def to_jsonable(value):
+    """Convert a report, record or section value to plain JSON-compatible data."""
+    if is_dataclass(value):
+        return asdict(value)
+    if isinstance(value, list):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    return value